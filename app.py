@@ -1,11 +1,19 @@
 import os
 import re
+import gzip
 import json
 import time
 import hashlib
 import datetime
 import statistics
 import sqlite3
+import threading
+import contextlib
+import collections
+import uuid
+import types
+import functools
+import importlib.util
 import requests
 import streamlit as st
 from deep_translator import GoogleTranslator
@@ -27,7 +35,7 @@ except Exception:
 # 0) CONFIG
 # ==============================================================================
 APP_TITLE = "🏆 XAU/USD Intelligence (M15 Snapshot Gate + Incremental + Macro Prompt)"
-DB_PATH = "xau_cache.sqlite3"
+DB_PATH = os.environ.get("XAU_DB_PATH", "xau_cache.sqlite3")
 PROMPT_VERSION = "xau_m15_gate_macro_v1"
 FETCH_LIMIT = 20
 
@@ -36,6 +44,7 @@ MODEL_LIST = [
     "qwen-3-235b-a22b-instruct-2507",
     "qwen-3-32b",
 ]
+AI_MAX_PASSES_PER_MODEL = 2  # passes per model; later passes re-request only the missing ids
 
 # yfinance tickers (NO fallback; if M15 empty => N/A)
 YF_TICKERS = {
@@ -51,6 +60,61 @@ DEFAULT_UI_TICK_SECONDS = 5
 DEFAULT_YF_DELAY_SECONDS = 1.0
 M15_SAFETY_SECONDS = 10
 
+# Circuit breakers (per upstream): trip on consecutive failures, or when the failure rate in the
+# window >= threshold. One news refresh records at most ~3 events per upstream, so the window spans
+# several refresh intervals and consecutive failures trip regardless of how far apart they are.
+BREAKER_WINDOW_SECONDS = 900
+BREAKER_MIN_CALLS = 4
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_CONSECUTIVE_FAILURES = 3
+BREAKER_OPEN_SECONDS = 240  # > default news refresh interval: the refresh after a trip skips the upstream
+BREAKER_MAX_OPEN_SECONDS = 900  # open time doubles after each failed half-open probe
+
+# Cross-process leases (SQLite locks table): one worker fetches/scores, others wait then read
+SNAPSHOT_LEASE_SECONDS = 120
+SCORE_LEASE_SECONDS = 180
+LEASE_WAIT_SECONDS = 8.0
+LEASE_POLL_SECONDS = 0.25
+
+# Local CPU scoring (zero-network fallback for items the LLM did not score)
+LOCAL_SCORING_ENABLED = True
+LOCAL_MODEL_NAME = "typeform/distilbert-base-uncased-mnli"
+LOCAL_MODEL_PATH = os.environ.get("XAU_LOCAL_MODEL_PATH", "")  # model dir; else the HF cache (never downloaded at runtime)
+LOCAL_MODEL_QUANTIZE = True  # dynamic int8 on Linear layers
+LOCAL_BATCH_SIZE = 16
+LOCAL_MIN_CONFIDENCE = 0.55
+LOCAL_PROMPT_VERSION = f"{PROMPT_VERSION}+local"
+LOCAL_MODEL_TAG = f"local:{LOCAL_MODEL_NAME}{'@int8' if LOCAL_MODEL_QUANTIZE else ''}"
+LOCAL_HYPOTHESES = {
+    "BUY": "This news is bullish for gold prices.",
+    "SELL": "This news is bearish for gold prices.",
+    "SIDEWAY": "This news is unrelated to gold prices.",
+}
+
+LANGUAGES = {"🇻🇳 Tiếng Việt": "vi", "🇬🇧 English": "en"}
+TIMEZONES = {
+    "Vietnam (UTC+7)": 7,
+    "New York (UTC-5)": -5,
+    "London (UTC+0)": 0,
+    "Tokyo (UTC+9)": 9,
+}
+TRANSLATE_BATCH_CHARS = 4500  # one Google Translate request per chunk (hard limit 5000)
+
+BATCH_KEEP_VERSIONS = 8  # shared batches kept in memory (sessions reference them by version id)
+
+# Retention: per-table age/row limits (None => unlimited). Runs at most once per interval.
+RETENTION_POLICY = {
+    "news": {"max_age_days": 90, "max_rows": 50000},
+    "translations": {"max_age_days": 90, "max_rows": 100000},
+    "scores": {"max_age_days": 90, "max_rows": 50000},
+    "bars": {"max_age_days": 180, "max_rows": None},
+}
+RETENTION_INTERVAL_SECONDS = 3600
+RETENTION_KEEP_PROMPT_VERSIONS = (PROMPT_VERSION, LOCAL_PROMPT_VERSION)
+RETENTION_ARCHIVE_DIR = ""  # e.g. "archive" => rows written to gzip JSONL before delete
+RETENTION_BATCH_ROWS = 2000  # rows deleted per rerun (bounded batches, like the vacuum step)
+VACUUM_STEP_PAGES = 64      # freelist pages released per rerun (incremental vacuum)
+
 # ==============================================================================
 # 1) SECRETS
 # ==============================================================================
@@ -147,29 +211,165 @@ st.markdown(
 )
 
 # ==============================================================================
-# 4) HTTP RETRY
+# 4) HTTP RETRY + CIRCUIT BREAKERS
 # ==============================================================================
-def http_get_retry(url, params=None, headers=None, timeout=10, retries=3, backoff=1.6):
+class CircuitOpenError(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    # closed -> open (consecutive failures / failure rate over window) -> half_open (one probe) -> closed/open
+    def __init__(self, name: str, window_seconds: float = BREAKER_WINDOW_SECONDS, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, consecutive_failures: int = BREAKER_CONSECUTIVE_FAILURES,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, max_open_seconds: float = BREAKER_MAX_OPEN_SECONDS):
+        self.name = name
+        self.window_seconds = float(window_seconds)
+        self.min_calls = int(min_calls)
+        self.failure_rate = float(failure_rate)
+        self.consecutive_failures = int(consecutive_failures)
+        self.open_seconds = float(open_seconds)
+        self.max_open_seconds = float(max_open_seconds)
+        self._events = collections.deque()  # (ts, ok)
+        self._consecutive = 0
+        self._trips = 0  # trips since the last success
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._open_for = self.open_seconds
+        self._probe_in_flight = False
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._events and now - self._events[0][0] > self.window_seconds:
+            self._events.popleft()
+
+    def _trip(self, now: float):
+        self._state = "open"
+        self._opened_at = now
+        self._open_for = min(self.max_open_seconds, self.open_seconds * 2 ** self._trips)
+        self._trips += 1
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.time() - self._opened_at >= self._open_for:
+                return "half_open"
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.time()
+            if self._state == "open":
+                if now - self._opened_at < self._open_for:
+                    return False
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "half_open":
+                # a probe that never reported back expires after open_seconds
+                if self._probe_in_flight and now - self._probe_at < self.open_seconds:
+                    return False
+                self._probe_in_flight = True
+                self._probe_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            now = time.time()
+            self._consecutive = 0
+            self._trips = 0
+            if self._state != "closed":
+                self._state = "closed"
+                self._probe_in_flight = False
+                self._events.clear()
+            self._events.append((now, True))
+            self._trim(now)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.time()
+            self._consecutive += 1
+            if self._state == "half_open":
+                self._trip(now)
+                return
+            self._events.append((now, False))
+            self._trim(now)
+            total = len(self._events)
+            fails = sum(1 for _, ok in self._events if not ok)
+            if self._consecutive >= self.consecutive_failures or (
+                    total >= self.min_calls and fails / total >= self.failure_rate):
+                self._trip(now)
+
+@st.cache_resource
+def _breaker_registry():
+    # process-wide: shared by every session/rerun
+    return {"lock": threading.Lock(), "items": {}}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    reg = _breaker_registry()
+    with reg["lock"]:
+        br = reg["items"].get(name)
+        if br is None:
+            br = CircuitBreaker(name)
+            reg["items"][name] = br
+        return br
+
+def degraded_upstreams() -> list[str]:
+    reg = _breaker_registry()
+    with reg["lock"]:
+        items = list(reg["items"].values())
+    return sorted(f"{b.name} ({b.state})" for b in items if b.state != "closed")
+
+def http_get_retry(url, params=None, headers=None, timeout=10, retries=3, backoff=1.6, breaker=None):
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpenError(f"circuit open: {breaker.name}")
     last_exc = None
     for i in range(retries):
         try:
             resp = requests.get(url, params=params, headers=headers, timeout=timeout)
             if resp.status_code in (429, 502, 503, 504):
+                if breaker is not None:
+                    breaker.record_failure()
+                    if breaker.state != "closed":
+                        return resp
                 time.sleep(backoff ** i)
                 continue
+            if breaker is not None:
+                breaker.record_success()
             return resp
         except Exception as e:
             last_exc = e
+            if breaker is not None:
+                breaker.record_failure()
+                if breaker.state != "closed":
+                    break
             time.sleep(backoff ** i)
     raise last_exc if last_exc else RuntimeError("http_get_retry failed")
 
 # ==============================================================================
 # 5) DB (SQLite) — FULL FUNCTIONS
 # ==============================================================================
+@st.cache_resource
+def _db_lock():
+    # init_db's connection is shared by every session thread and sqlite3 keeps one implicit transaction
+    # per connection: concurrent reruns interleaved statements/commits ("cannot start a transaction within
+    # a transaction"). Every helper touching the connection holds this for its whole body (reentrant).
+    return threading.RLock()
+
+def db_serialized(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _db_lock():
+            return fn(*args, **kwargs)
+    return wrapper
+
 @st.cache_resource
 def init_db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # timeout => writers from other workers/processes wait on SQLITE_BUSY instead of failing
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
     cur = conn.cursor()
+    # incremental auto_vacuum: takes effect on a new DB only (before the first table);
+    # existing DBs are converted offline (python maintenance.py --enable-incremental-vacuum)
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS news (
         fp TEXT PRIMARY KEY,
@@ -200,20 +400,39 @@ def init_db():
     );
     """)
     cur.execute("""
+    CREATE TABLE IF NOT EXISTS bars (
+        ticker TEXT,
+        ts INTEGER,
+        close REAL,
+        PRIMARY KEY (ticker, ts)
+    );
+    """)
+    cur.execute("""
     CREATE TABLE IF NOT EXISTS meta (
         k TEXT PRIMARY KEY,
         v TEXT
     );
     """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS locks (
+        name TEXT PRIMARY KEY,
+        owner TEXT,
+        expires_at REAL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_news_source_ts ON news(source_ts)")
+    cur.execute("PRAGMA journal_mode=WAL")
     conn.commit()
     return conn
 
+@db_serialized
 def db_get_meta(conn, key: str):
     cur = conn.cursor()
     cur.execute("SELECT v FROM meta WHERE k=?", (key,))
     r = cur.fetchone()
     return r[0] if r else None
 
+@db_serialized
 def db_set_meta(conn, key: str, value: str):
     cur = conn.cursor()
     cur.execute("""
@@ -222,6 +441,7 @@ def db_set_meta(conn, key: str, value: str):
     """, (key, value))
     conn.commit()
 
+@db_serialized
 def db_upsert_news(conn, fp: str, source_ts: int, raw_text: str):
     cur = conn.cursor()
     cur.execute("""
@@ -233,12 +453,21 @@ def db_upsert_news(conn, fp: str, source_ts: int, raw_text: str):
     """, (fp, source_ts, raw_text, int(time.time())))
     conn.commit()
 
+@db_serialized
+def db_get_recent_news(conn, limit: int = 20):
+    # newest stored items, shaped like vnwallstreet rows (served while the upstream is down)
+    cur = conn.cursor()
+    cur.execute("SELECT source_ts, raw_text FROM news ORDER BY source_ts DESC LIMIT ?", (int(limit),))
+    return [{"createtime": r[0], "content": r[1]} for r in cur.fetchall()]
+
+@db_serialized
 def db_get_translation(conn, fp: str, lang: str):
     cur = conn.cursor()
     cur.execute("SELECT text FROM translations WHERE fp=? AND lang=?", (fp, lang))
     r = cur.fetchone()
     return r[0] if r else None
 
+@db_serialized
 def db_set_translation(conn, fp: str, lang: str, text: str):
     cur = conn.cursor()
     cur.execute("""
@@ -250,6 +479,34 @@ def db_set_translation(conn, fp: str, lang: str, text: str):
     """, (fp, lang, text, int(time.time())))
     conn.commit()
 
+@db_serialized
+def db_get_translations(conn, fps: list[str], lang: str) -> dict:
+    out = {}
+    cur = conn.cursor()
+    for start in range(0, len(fps), 500):
+        chunk = fps[start:start + 500]
+        cur.execute(
+            f"SELECT fp, text FROM translations WHERE lang=? AND fp IN ({','.join('?' * len(chunk))})",
+            (lang, *chunk),
+        )
+        out.update(cur.fetchall())
+    return out
+
+@db_serialized
+def db_set_translations(conn, lang: str, pairs):
+    # pairs: iterable of (fp, text)
+    now_ts = int(time.time())
+    cur = conn.cursor()
+    cur.executemany("""
+    INSERT INTO translations(fp, lang, text, updated_at)
+    VALUES(?,?,?,?)
+    ON CONFLICT(fp,lang) DO UPDATE SET
+        text=excluded.text,
+        updated_at=excluded.updated_at
+    """, [(fp, lang, text, now_ts) for fp, text in pairs])
+    conn.commit()
+
+@db_serialized
 def db_get_score(conn, fp: str, prompt_version: str):
     cur = conn.cursor()
     cur.execute("""
@@ -262,6 +519,7 @@ def db_get_score(conn, fp: str, prompt_version: str):
         return None
     return {"model": r[0], "signal": r[1], "score": float(r[2]), "reason": r[3], "updated_at": int(r[4])}
 
+@db_serialized
 def db_set_score(conn, fp: str, prompt_version: str, model: str, signal: str, score: float, reason: str):
     cur = conn.cursor()
     cur.execute("""
@@ -276,8 +534,173 @@ def db_set_score(conn, fp: str, prompt_version: str, model: str, signal: str, sc
     """, (fp, prompt_version, model, signal, float(score), reason, int(time.time())))
     conn.commit()
 
+@db_serialized
+def db_upsert_bars(conn, ticker: str, rows):
+    # rows: iterable of (bar_open_ts_utc, close)
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO bars(ticker, ts, close) VALUES(?,?,?)
+        ON CONFLICT(ticker, ts) DO UPDATE SET close=excluded.close
+    """, [(ticker, int(ts), float(c)) for ts, c in rows])
+    conn.commit()
+
+# ------------------------------------------------------------------------------
+# 5a) LEASES (cross-process locks with expiry)
+# ------------------------------------------------------------------------------
+@db_serialized
+def db_try_acquire_lease(conn, name: str, ttl_seconds: float):
+    # single upsert => atomic across processes; returns owner token or None
+    token = uuid.uuid4().hex
+    now = time.time()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO locks(name, owner, expires_at) VALUES(?,?,?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner=excluded.owner,
+            expires_at=excluded.expires_at
+        WHERE locks.expires_at < ?
+    """, (name, token, now + float(ttl_seconds), now))
+    acquired = cur.rowcount == 1
+    conn.commit()
+    return token if acquired else None
+
+@db_serialized
+def db_release_lease(conn, name: str, token: str):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM locks WHERE name=? AND owner=?", (name, token))
+    conn.commit()
+
+@contextlib.contextmanager
+def db_lease(conn, name: str, ttl_seconds: float):
+    token = db_try_acquire_lease(conn, name, ttl_seconds)
+    try:
+        yield token is not None
+    finally:
+        if token:
+            db_release_lease(conn, name, token)
+
+def wait_for(fn, timeout: float = LEASE_WAIT_SECONDS, poll: float = LEASE_POLL_SECONDS):
+    # poll fn() until truthy or timeout; returns last value
+    deadline = time.time() + max(0.0, float(timeout))
+    while True:
+        v = fn()
+        if v or time.time() >= deadline:
+            return v
+        time.sleep(poll)
+
+# ------------------------------------------------------------------------------
+# 5b) RETENTION / ARCHIVE / INCREMENTAL VACUUM
+# ------------------------------------------------------------------------------
+RETENTION_TS_COLUMNS = {"news": "source_ts", "translations": "updated_at", "scores": "updated_at", "bars": "ts"}
+
+@db_serialized
+def db_archive_and_delete(conn, table: str, where: str, params=(), archive_dir: str = RETENTION_ARCHIVE_DIR,
+                          limit: int = RETENTION_BATCH_ROWS) -> int:
+    # at most `limit` rows; no commit here: caller commits once so archive + delete stay in one transaction
+    if limit <= 0:
+        return 0
+    cur = conn.cursor()
+    cur.execute(f"SELECT rowid FROM {table} WHERE {where} LIMIT ?", (*params, int(limit)))
+    rowids = [r[0] for r in cur.fetchall()]
+    if not rowids:
+        return 0
+    if archive_dir:
+        rows, cols = [], []
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            cur.execute(f"SELECT * FROM {table} WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+            cols = [d[0] for d in cur.description]
+            rows.extend(cur.fetchall())
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"{table}_{datetime.datetime.utcnow().strftime('%Y%m%d')}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(dict(zip(cols, r)), ensure_ascii=False) + "\n")
+    cur.executemany(f"DELETE FROM {table} WHERE rowid=?", [(r,) for r in rowids])
+    return len(rowids)
+
+@db_serialized
+def db_apply_retention(conn, policy: dict = RETENTION_POLICY, keep_prompt_versions=RETENTION_KEEP_PROMPT_VERSIONS,
+                       keep_langs=None, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                       budget: int = RETENTION_BATCH_ROWS) -> dict:
+    # one bounded batch (<= budget rows, one transaction); "more" => call again on a later rerun
+    removed = {}
+    left = int(budget)
+    now_ts = int(time.time())
+    keep_langs = tuple(keep_langs if keep_langs is not None else LANGUAGES.values())
+
+    def purge(key, table, where, params=()):
+        nonlocal left
+        n = db_archive_and_delete(conn, table, where, params, archive_dir, left)
+        removed[key] = removed.get(key, 0) + n
+        left -= n
+
+    try:
+        # retired prompt versions / languages
+        if keep_prompt_versions:
+            qs = ",".join("?" * len(keep_prompt_versions))
+            purge("scores_retired", "scores", f"prompt_version NOT IN ({qs})", tuple(keep_prompt_versions))
+        if keep_langs:
+            qs = ",".join("?" * len(keep_langs))
+            purge("translations_retired", "translations", f"lang NOT IN ({qs})", keep_langs)
+
+        # age + row limits
+        for table, rules in policy.items():
+            ts_col = RETENTION_TS_COLUMNS.get(table)
+            if not ts_col:
+                continue
+            removed.setdefault(table, 0)
+            max_age_days = rules.get("max_age_days")
+            if max_age_days:
+                cutoff = now_ts - int(float(max_age_days) * 86400)
+                purge(table, table, f"{ts_col} < ?", (cutoff,))
+            max_rows = rules.get("max_rows")
+            if max_rows:
+                purge(table, table,
+                      f"rowid IN (SELECT rowid FROM {table} ORDER BY {ts_col} DESC LIMIT -1 OFFSET ?)",
+                      (int(max_rows),))
+
+        # translations/scores whose news row is gone
+        purge("orphans", "translations", "fp NOT IN (SELECT fp FROM news)")
+        purge("orphans", "scores", "fp NOT IN (SELECT fp FROM news)")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    removed["more"] = left <= 0
+    return removed
+
+def maybe_run_retention(conn, interval_seconds: int = RETENTION_INTERVAL_SECONDS):
+    # the lease expiring is the interval gate (one worker per interval); it is released early
+    # while a pass still has rows left, so the next rerun deletes the next batch
+    token = db_try_acquire_lease(conn, "retention", interval_seconds)
+    if token is None:
+        return None
+    removed = db_apply_retention(conn)
+    db_set_meta(conn, "retention_last_run", str(int(time.time())))
+    db_set_meta(conn, "retention_last_result", json.dumps(removed))
+    if removed["more"]:
+        db_release_lease(conn, "retention", token)
+    return removed
+
+@db_serialized
+def db_incremental_vacuum_step(conn, pages: int = VACUUM_STEP_PAGES) -> int:
+    # small bounded step; a no-op when the freelist is empty or the DB is not converted yet
+    cur = conn.cursor()
+    cur.execute("PRAGMA auto_vacuum")
+    if cur.fetchone()[0] != 2:
+        return 0
+    cur.execute("PRAGMA freelist_count")
+    free = int(cur.fetchone()[0] or 0)
+    if free <= 0:
+        return 0
+    step = min(free, max(1, int(pages)))
+    # executescript runs the pragma to completion (execute() frees one page per step)
+    conn.executescript(f"PRAGMA incremental_vacuum({step});")
+    return step
+
 # ==============================================================================
-# 6) UTILS: normalize/fingerprint/translate/json parse
+# 6) UTILS: normalize/fingerprint/translate/json parse+validate
 # ==============================================================================
 def normalize_text(s: str) -> str:
     s = (s or "").strip()
@@ -290,38 +713,141 @@ def fingerprint_item(source_ts: int, raw_text: str) -> str:
 
 @st.cache_data(ttl=3600, show_spinner=False)
 def translate_runtime(text: str, target: str) -> str:
+    # raises on failure/open circuit so the fallback is neither cached nor stored
     if not text:
         return ""
     if target == "vi":
         return text
+    breaker = get_breaker("google_translate")
+    if not breaker.allow():
+        raise CircuitOpenError("circuit open: google_translate")
     try:
-        return GoogleTranslator(source="auto", target=target).translate(text)
+        out = GoogleTranslator(source="auto", target=target).translate(text)
     except Exception:
-        return text
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return out
+
+TRANSLATE_ITEM_RE = re.compile(r"^\s*\[\s*(\d+)\s*\]\s*(.*)$")
+
+def split_numbered_lines(joined: str, n: int):
+    # "[k] text" per line -> [text] * n, or None unless every k in 0..n-1 appears exactly once
+    # and no line lost its marker (a split/merged line would shift translations onto other items)
+    parts = {}
+    for line in (joined or "").split("\n"):
+        if not line.strip():
+            continue
+        m = TRANSLATE_ITEM_RE.match(line)
+        if not m or int(m.group(1)) in parts:
+            return None
+        parts[int(m.group(1))] = m.group(2).strip()
+    if sorted(parts) != list(range(n)):
+        return None
+    return [parts[k] for k in range(n)]
 
-def get_or_make_translation(conn, fp: str, raw_text: str, lang: str) -> str:
-    t = db_get_translation(conn, fp, lang)
-    if t is not None:
-        return t
-    if lang == "vi":
-        t = raw_text
-    else:
-        t = translate_runtime(raw_text, lang)
-    db_set_translation(conn, fp, lang, t)
-    return t
+def translate_many(texts: list[str], target: str) -> list:
+    # "[k] text" lines joined per chunk => one request per ~TRANSLATE_BATCH_CHARS (normalized texts have
+    # no newlines); None where translation failed (caller shows raw text, does not store)
+    if target == "vi":
+        return list(texts)
+    out = [None] * len(texts)
+    chunks, cur_idx, cur_len = [], [], 0
+    for i, t in enumerate(texts):
+        line_len = len(t) + 8  # "[k] " marker + newline
+        if cur_idx and cur_len + line_len > TRANSLATE_BATCH_CHARS:
+            chunks.append(cur_idx)
+            cur_idx, cur_len = [], 0
+        cur_idx.append(i)
+        cur_len += line_len
+    if cur_idx:
+        chunks.append(cur_idx)
+
+    for idx in chunks:
+        try:
+            joined = translate_runtime("\n".join(f"[{k}] {texts[i]}" for k, i in enumerate(idx)), target)
+        except Exception:
+            continue  # circuit open / upstream error
+        parts = split_numbered_lines(joined, len(idx))
+        if parts is not None:
+            for i, p in zip(idx, parts):
+                out[i] = p
+            continue
+        # markers not preserved: per-item for this chunk
+        for i in idx:
+            try:
+                out[i] = translate_runtime(texts[i], target)
+            except Exception:
+                break
+    return out
+
+def get_or_make_translations(conn, fps: list[str], raw_texts: list[str], langs) -> dict:
+    # -> {lang: [text or None per item]} from DB, missing ones in one batched pass per language
+    # (None = translation failed; callers decide whether the raw text is an acceptable stand-in)
+    result = {}
+    for lang in langs:
+        known = db_get_translations(conn, fps, lang)
+        missing = [i for i, fp in enumerate(fps) if fp not in known]
+        if missing:
+            translated = translate_many([raw_texts[i] for i in missing], lang)
+            fresh = [(fps[i], t) for i, t in zip(missing, translated) if t is not None]
+            if fresh:
+                db_set_translations(conn, lang, fresh)
+                known.update(fresh)
+        result[lang] = [known.get(fp) for fp in fps]
+    return result
+
+def _strip_code_fence(raw: str) -> str:
+    if "```json" in raw:
+        return raw.split("```json", 1)[1].split("```", 1)[0]
+    if "```" in raw:
+        return raw.split("```", 1)[1].split("```", 1)[0]
+    return raw
 
-def parse_json_array_loose(s: str):
+def parse_json_objects_tolerant(s: str) -> list:
+    # every well-formed top-level {...} of a possibly truncated/malformed JSON array
     if not s:
+        return []
+    raw = _strip_code_fence(s.strip())
+    dec = json.JSONDecoder()
+    start = raw.find("[")
+    pos = start + 1 if start >= 0 else 0
+    out = []
+    while True:
+        i = raw.find("{", pos)
+        if i < 0:
+            break
+        try:
+            obj, end = dec.raw_decode(raw, i)
+        except ValueError:
+            # broken object: resync on the next "{" (schema has no nested objects)
+            pos = i + 1
+            continue
+        if isinstance(obj, dict):
+            out.append(obj)
+        pos = end
+    return out
+
+def validate_score_item(obj, n_items: int):
+    # -> normalized {id, signal, score, reason} or None (counts as missing => re-requested)
+    if not isinstance(obj, dict):
         return None
-    raw = s.strip()
-    if "```json" in raw:
-        raw = raw.split("```json", 1)[1].split("```", 1)[0]
-    elif "```" in raw:
-        raw = raw.split("```", 1)[1].split("```", 1)[0]
-    m = re.search(r"\[.*\]", raw, flags=re.DOTALL)
-    if m:
-        return json.loads(m.group(0))
-    return json.loads(raw)
+    try:
+        idx = int(obj.get("id"))
+        score = float(obj.get("score"))
+    except Exception:
+        return None
+    if not (0 <= idx < n_items) or score != score:
+        return None
+    signal = str(obj.get("signal", "")).upper().strip()
+    if signal not in ("BUY", "SELL", "SIDEWAY"):
+        return None
+    return {
+        "id": idx,
+        "signal": signal,
+        "score": max(0.0, min(0.99, score)),
+        "reason": str(obj.get("reason", "") or "").strip(),
+    }
 
 # ==============================================================================
 # 7) NEWS FETCH (VNWALLSTREET signature)
@@ -350,7 +876,8 @@ def fetch_latest_news(limit: int = 20):
         del params["key_"]
         params["sign_"] = sign
 
-        resp = http_get_retry(API_URL, params=params, headers=HEADERS, timeout=10, retries=3)
+        resp = http_get_retry(API_URL, params=params, headers=HEADERS, timeout=10, retries=3,
+                              breaker=get_breaker("vnwallstreet"))
         if resp.status_code != 200:
             return [], f"HTTP {resp.status_code}: {resp.text[:300]}"
         data = resp.json()
@@ -381,7 +908,7 @@ def next_m15_close_seconds_left(safety_seconds: int = 10) -> int:
 # ==============================================================================
 # 9) YFINANCE M15 FETCH (NO FALLBACK): sequential + delay
 # ==============================================================================
-def yf_fetch_m15_one(ticker: str):
+def yf_fetch_m15_one(ticker: str, conn=None):
     if not YF_AVAILABLE:
         return {"ok": False, "price": None, "chg_15m_pct": None, "last_bar": None}
 
@@ -393,6 +920,11 @@ def yf_fetch_m15_one(ticker: str):
     if len(closes) < 2:
         return {"ok": False, "price": None, "chg_15m_pct": None, "last_bar": None}
 
+    if conn is not None:
+        # keep the bars for replay/backtest (multi-ticker frames: first column)
+        series = closes.iloc[:, 0] if hasattr(closes, "columns") else closes
+        db_upsert_bars(conn, ticker, [(ts.timestamp(), c) for ts, c in series.dropna().items()])
+
     curr = float(closes.iloc[-1])
     prev = float(closes.iloc[-2])
     chg = (curr / prev - 1.0) * 100.0
@@ -409,50 +941,90 @@ def yf_fetch_m15_one(ticker: str):
         "last_bar": last_bar
     }
 
-def update_snapshot_if_m15_closed(conn, per_ticker_delay: float, safety_seconds: int = 10):
-    key = last_completed_m15_key_utc(safety_seconds=safety_seconds)
-
-    last_key = db_get_meta(conn, "snapshot_m15_key") or ""
-    attempt_key = db_get_meta(conn, "snapshot_attempt_key") or ""
+def _snapshot_for_key(conn, key: str):
+    if (db_get_meta(conn, "snapshot_m15_key") or "") != key:
+        return None
     cached_json = db_get_meta(conn, "snapshot_json")
+    try:
+        return json.loads(cached_json) if cached_json else None
+    except Exception:
+        return None
 
-    if attempt_key == key and cached_json:
-        try:
-            return json.loads(cached_json)
-        except Exception:
-            pass
-
-    if last_key == key and cached_json:
-        try:
-            return json.loads(cached_json)
-        except Exception:
-            pass
-
-    db_set_meta(conn, "snapshot_attempt_key", key)
+def _stale_snapshot(conn, **flags):
+    cached_json = db_get_meta(conn, "snapshot_json")
+    try:
+        stale = json.loads(cached_json) if cached_json else None
+    except Exception:
+        stale = None
+    if stale is not None:
+        stale.update(flags)
+    return stale
 
-    snapshot = {
-        "asof_utc": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-        "m15_key_utc": key,
-        "source": "yfinance_15m",
-        "data": {},
-        "error": None,
-        "note": "NO FALLBACK. If 15m data missing => N/A."
-    }
+def update_snapshot_if_m15_closed(conn, per_ticker_delay: float, safety_seconds: int = 10):
+    key = last_completed_m15_key_utc(safety_seconds=safety_seconds)
 
-    if not YF_AVAILABLE:
-        snapshot["error"] = "yfinance not installed"
-    else:
-        for name, ticker in YF_TICKERS.items():
-            try:
-                snapshot["data"][name] = yf_fetch_m15_one(ticker)
-            except Exception as e:
-                snapshot["data"][name] = {"ok": False, "price": None, "chg_15m_pct": None, "last_bar": None}
-                snapshot["error"] = f"yfinance error: {e}"
-            time.sleep(max(0.0, float(per_ticker_delay)))
+    cached = _snapshot_for_key(conn, key)
+    if cached is not None:
+        return cached
+
+    breaker = get_breaker("yfinance")
+    if YF_AVAILABLE and breaker.state == "open":
+        # serve the last snapshot; this bucket is retried once the breaker half-opens
+        stale = _stale_snapshot(conn, degraded=True)
+        if stale is not None:
+            return stale
+
+    with db_lease(conn, f"snapshot:{key}", SNAPSHOT_LEASE_SECONDS) as owner:
+        if not owner:
+            # another worker is downloading this bucket: wait briefly, then fall back to the previous one
+            snap = wait_for(lambda: _snapshot_for_key(conn, key))
+            return snap or _stale_snapshot(conn, pending=True) or {
+                "asof_utc": None, "m15_key_utc": key, "source": "yfinance_15m",
+                "data": {}, "error": "snapshot refresh in progress (other worker)", "note": "",
+            }
+
+        cached = _snapshot_for_key(conn, key)
+        if cached is not None:
+            return cached
+
+        snapshot = {
+            "asof_utc": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "m15_key_utc": key,
+            "source": "yfinance_15m",
+            "data": {},
+            "error": None,
+            "note": "NO FALLBACK. If 15m data missing => N/A."
+        }
 
-    db_set_meta(conn, "snapshot_json", json.dumps(snapshot, ensure_ascii=False))
-    db_set_meta(conn, "snapshot_m15_key", key)
-    return snapshot
+        if not YF_AVAILABLE:
+            snapshot["error"] = "yfinance not installed"
+        else:
+            empty = 0
+            for name, ticker in YF_TICKERS.items():
+                if not breaker.allow():
+                    snapshot["data"][name] = {"ok": False, "price": None, "chg_15m_pct": None, "last_bar": None}
+                    snapshot["error"] = "yfinance circuit open"
+                    snapshot["degraded"] = True
+                    continue
+                try:
+                    snapshot["data"][name] = yf_fetch_m15_one(ticker, conn=conn)
+                    if snapshot["data"][name]["ok"]:
+                        breaker.record_success()
+                    else:
+                        empty += 1  # no 15m bars for this ticker => N/A, not an upstream failure by itself
+                except Exception as e:
+                    breaker.record_failure()
+                    snapshot["data"][name] = {"ok": False, "price": None, "chg_15m_pct": None, "last_bar": None}
+                    snapshot["error"] = f"yfinance error: {e}"
+                time.sleep(max(0.0, float(per_ticker_delay)))
+            if empty == len(YF_TICKERS):
+                # yf.download swallows network/HTTP errors and returns empty frames: all empty => outage
+                breaker.record_failure()
+                snapshot["error"] = snapshot["error"] or "yfinance returned no 15m data"
+
+        db_set_meta(conn, "snapshot_json", json.dumps(snapshot, ensure_ascii=False))
+        db_set_meta(conn, "snapshot_m15_key", key)
+        return snapshot
 
 # ==============================================================================
 # 10) AI PROMPT (FULL macro logic incl. Fed/Inflation/Risk-off USD+Gold)
@@ -523,41 +1095,211 @@ OUTPUT:
 PROMPT_VERSION: {PROMPT_VERSION}
 """
 
-def call_ai_with_fallback(english_items: list[str], lang_instruction: str, snapshot: dict):
+def call_ai_with_fallback(english_items: list[str], lang_instruction: str, snapshot: dict, ids=None):
+    # -> (valid items with original ids + "model", last model used, last raw, err, missing ids)
+    pending = list(range(len(english_items))) if ids is None else [int(i) for i in ids]
     if not AI_AVAILABLE or client is None:
-        return [], None, None, "AI not available"
-
-    n = len(english_items)
-    user_content = "\n".join([f"ID {i}: {english_items[i]}" for i in range(n)])
-    system_prompt = build_prompt(lang_instruction, n, json.dumps(snapshot, ensure_ascii=False))
+        return [], None, None, "AI not available", pending
 
+    snapshot_json = json.dumps(snapshot, ensure_ascii=False)
+    results = {}
+    used_model = None
     last_raw = None
     last_err = None
 
     for model_name in MODEL_LIST:
-        try:
-            resp = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "system", "content": system_prompt},
-                          {"role": "user", "content": user_content}],
-                temperature=0.1,
-                max_tokens=4000,
-            )
-            raw = resp.choices[0].message.content
+        breaker = get_breaker(f"cerebras:{model_name}")
+        passes = 0
+        while pending and passes < AI_MAX_PASSES_PER_MODEL:
+            passes += 1
+            if not breaker.allow():
+                last_err = f"{model_name} skipped: circuit open"
+                break
+            # only the still-missing items, renumbered 0..k-1 (prompt requires every ID)
+            user_content = "\n".join([f"ID {k}: {english_items[i]}" for k, i in enumerate(pending)])
+            system_prompt = build_prompt(lang_instruction, len(pending), snapshot_json)
+            try:
+                resp = client.chat.completions.create(
+                    model=model_name,
+                    messages=[{"role": "system", "content": system_prompt},
+                              {"role": "user", "content": user_content}],
+                    temperature=0.1,
+                    max_tokens=4000,
+                )
+                raw = resp.choices[0].message.content
+            except Exception as e:
+                breaker.record_failure()
+                last_err = f"{model_name} failed: {e}"
+                break
+            breaker.record_success()
             last_raw = raw
-            arr = parse_json_array_loose(raw)
-            if not isinstance(arr, list):
-                raise ValueError("AI output not JSON array")
-            return arr, model_name, raw, None
-        except Exception as e:
-            last_err = f"{model_name} failed: {e}"
-            continue
 
-    return [], None, last_raw, last_err or "All models failed"
+            got = 0
+            for obj in parse_json_objects_tolerant(raw):
+                item = validate_score_item(obj, len(pending))
+                if item is None or pending[item["id"]] in results:
+                    continue
+                item["id"] = pending[item["id"]]
+                item["model"] = model_name
+                results[item["id"]] = item
+                got += 1
+            pending = [i for i in pending if i not in results]
+            if not got:
+                last_err = f"{model_name} failed: no valid items in output"
+                break
+            used_model = model_name
+            if pending:
+                last_err = f"{model_name} partial: missing ids {pending}"
+        if not pending:
+            break
+
+    items = [results[i] for i in sorted(results)]
+    if not pending:
+        return items, used_model, last_raw, None, []
+    return items, used_model, last_raw, last_err or "All models failed", pending
+
+# ------------------------------------------------------------------------------
+# 10b) LOCAL MODEL (CPU, zero-shot NLI over the English text)
+# ------------------------------------------------------------------------------
+# torch/transformers are only imported on first use (load_local_model): a worker that never
+# needs the local fallback does not pay their startup time and memory
+LOCAL_AI_AVAILABLE = LOCAL_SCORING_ENABLED and all(
+    importlib.util.find_spec(m) is not None for m in ("torch", "transformers"))
+
+@st.cache_resource(show_spinner=False)
+def load_local_model():
+    # disk only (python maintenance.py --fetch-local-model); a failed load is cached as well,
+    # so an offline worker does not retry on every refresh
+    source = LOCAL_MODEL_PATH or LOCAL_MODEL_NAME
+    try:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        tok = AutoTokenizer.from_pretrained(source, local_files_only=True)
+        model = AutoModelForSequenceClassification.from_pretrained(source, local_files_only=True)
+        model.eval()
+        if LOCAL_MODEL_QUANTIZE:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as e:
+        return None, None, None, f"cannot load {source} from disk: {type(e).__name__}"
+    label2id = {str(k).lower(): int(v) for k, v in (model.config.label2id or {}).items()}
+    entail_id = next((v for k, v in label2id.items() if k.startswith("entail")), model.config.num_labels - 1)
+    return tok, model, entail_id, None
+
+def score_local(english_items: list[str]):
+    # same {id, signal, score, reason} items as the LLM path
+    if not LOCAL_AI_AVAILABLE:
+        return [], None, "Local model not available"
+    tok, model, entail_id, load_err = load_local_model()
+    if load_err:
+        return [], None, f"Local model unavailable: {load_err}"
+    import torch  # already loaded by load_local_model
+    try:
+        signals = list(LOCAL_HYPOTHESES.keys())
+        hyps = list(LOCAL_HYPOTHESES.values())
+        out = []
+        for start in range(0, len(english_items), LOCAL_BATCH_SIZE):
+            chunk = [t or "" for t in english_items[start:start + LOCAL_BATCH_SIZE]]
+            enc = tok([t for t in chunk for _ in hyps], hyps * len(chunk),
+                      return_tensors="pt", padding=True, truncation="only_first", max_length=256)
+            with torch.inference_mode():
+                logits = model(**enc).logits[:, entail_id].reshape(len(chunk), len(hyps))
+            probs = torch.softmax(logits, dim=-1).tolist()
+            for k, p in enumerate(probs):
+                best = max(range(len(signals)), key=lambda j: p[j])
+                signal, conf = signals[best], float(p[best])
+                reason = f"Local NLI: {signal.lower()} p={conf:.2f}"
+                if not chunk[k] or signal == "SIDEWAY" or conf < LOCAL_MIN_CONFIDENCE:
+                    if signal != "SIDEWAY":
+                        reason += " (low confidence)"
+                    signal, score = "SIDEWAY", 0.0
+                else:
+                    score = round(min(0.99, conf), 2)
+                out.append({"id": start + k, "signal": signal, "score": score, "reason": reason})
+        return out, LOCAL_MODEL_TAG, None
+    except Exception as e:
+        return [], None, f"Local model failed: {e}"
 
 # ==============================================================================
-# 11) SESSION STATE
+# 11) SESSION STATE + SHARED BATCH (process-wide hot set)
 # ==============================================================================
+def format_times(ts, offset_hours: int) -> tuple:
+    tz = datetime.timezone(datetime.timedelta(hours=offset_hours))
+    out = []
+    for t in ts:
+        try:
+            out.append(datetime.datetime.fromtimestamp(t, tz).strftime("%H:%M"))
+        except Exception:
+            out.append("--:--")
+    return tuple(out)
+
+class NewsBatch:
+    # immutable struct-of-arrays; sessions only keep `version`
+    __slots__ = ("version", "created_at", "fps", "ts", "texts", "times", "signals", "scores", "reasons", "avg")
+
+    def __init__(self, fps, ts, texts: dict, signals, scores, reasons, created_at=None):
+        fps, ts = tuple(fps), tuple(int(t) for t in ts)
+        signals, scores, reasons = tuple(signals), tuple(float(x) for x in scores), tuple(reasons)
+        texts = types.MappingProxyType({lang: tuple(v) for lang, v in texts.items()})
+        times = types.MappingProxyType({label: format_times(ts, hours) for label, hours in TIMEZONES.items()})
+        signed = [s if sig == "BUY" else -s for sig, s in zip(signals, scores) if sig in ("BUY", "SELL") and s > 0]
+        version = hashlib.sha1(
+            json.dumps([fps, signals, scores, reasons, sorted(texts.items())], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        for k, v in (
+            ("version", version),
+            ("created_at", float(created_at if created_at is not None else time.time())),
+            ("fps", fps), ("ts", ts), ("texts", texts), ("times", times),
+            ("signals", signals), ("scores", scores), ("reasons", reasons),
+            ("avg", statistics.mean(signed) if signed else 0.0),
+        ):
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, k, v):
+        raise AttributeError("NewsBatch is immutable")
+
+    def __len__(self):
+        return len(self.fps)
+
+def make_batch(current: list[dict], texts: dict, scores: list) -> NewsBatch:
+    signals, values, reasons = [], [], []
+    for sc in scores:
+        sig = (sc.get("signal") or "SIDEWAY").upper() if sc else "SIDEWAY"
+        signals.append(sig if sig in ("BUY", "SELL", "SIDEWAY") else "SIDEWAY")
+        values.append(float(sc.get("score") or 0.0) if sc else 0.0)
+        reasons.append((sc.get("reason") or "") if sc else "")
+    return NewsBatch([it["fp"] for it in current], [it["ts"] for it in current], texts, signals, values, reasons)
+
+@st.cache_resource
+def _batch_store():
+    return {"lock": threading.Lock(), "versions": collections.OrderedDict(), "latest": None, "published_at": 0.0}
+
+def publish_batch(batch: NewsBatch) -> str:
+    # republishing unchanged content keeps the stored batch but refreshes the publish time
+    store = _batch_store()
+    with store["lock"]:
+        versions = store["versions"]
+        if batch.version in versions:
+            versions.move_to_end(batch.version)
+        else:
+            versions[batch.version] = batch
+            while len(versions) > BATCH_KEEP_VERSIONS:
+                versions.popitem(last=False)
+        store["latest"] = batch.version
+        store["published_at"] = time.time()
+    return batch.version
+
+def get_batch(version: str):
+    # evicted versions fall back to the latest batch
+    store = _batch_store()
+    with store["lock"]:
+        return store["versions"].get(version) or store["versions"].get(store["latest"])
+
+def latest_batch():
+    # -> (batch, published_at); published_at is the last fetch that produced it, not its first build
+    store = _batch_store()
+    with store["lock"]:
+        return store["versions"].get(store["latest"]), store["published_at"]
+
 def ensure_state():
     if "next_news_refresh_at" not in st.session_state:
         st.session_state.next_news_refresh_at = time.time() + DEFAULT_NEWS_REFRESH_SECONDS
@@ -575,12 +1317,8 @@ def ensure_state():
         st.session_state.last_status_msg = ""
     if "last_model_used" not in st.session_state:
         st.session_state.last_model_used = ""
-    if "current_batch" not in st.session_state:
-        st.session_state.current_batch = []
-    if "_display_texts" not in st.session_state:
-        st.session_state._display_texts = []
-    if "_cached_scores" not in st.session_state:
-        st.session_state._cached_scores = []
+    if "batch_version" not in st.session_state:
+        st.session_state.batch_version = ""
 
 ensure_state()
 
@@ -595,21 +1333,12 @@ with st.container():
     c1, c2, c3, c4 = st.columns([1.4, 1.4, 1.2, 1.2])
 
     with c1:
-        LANGUAGES = {"🇻🇳 Tiếng Việt": "vi", "🇬🇧 English": "en"}
         sel_lang = st.selectbox("Ngôn ngữ / Language:", list(LANGUAGES.keys()))
         target_lang = LANGUAGES[sel_lang]
         ai_lang_instruction = "Vietnamese" if target_lang == "vi" else "English"
 
     with c2:
-        TIMEZONES = {
-            "Vietnam (UTC+7)": 7,
-            "New York (UTC-5)": -5,
-            "London (UTC+0)": 0,
-            "Tokyo (UTC+9)": 9,
-        }
         sel_tz = st.selectbox("Múi giờ / Timezone:", list(TIMEZONES.keys()), index=0)
-        tz_offset = TIMEZONES[sel_tz]
-        CURRENT_TZ = datetime.timezone(datetime.timedelta(hours=tz_offset))
 
     with c3:
         st.session_state.news_refresh_seconds = int(st.number_input(
@@ -642,9 +1371,14 @@ with st.container():
 st.caption(
     f"AI: {'ON' if AI_AVAILABLE else 'OFF'} | "
     f"VNW key: {'OK' if bool(VNWALLSTREET_SECRET_KEY) else 'MISSING'} | "
-    f"YF: {'ON' if YF_AVAILABLE else 'OFF'} | Prompt: {PROMPT_VERSION}"
+    f"YF: {'ON' if YF_AVAILABLE else 'OFF'} | "
+    f"Local: {'ON' if (LOCAL_AI_AVAILABLE and LOCAL_SCORING_ENABLED) else 'OFF'} | Prompt: {PROMPT_VERSION}"
 )
 
+degraded = degraded_upstreams()
+if degraded:
+    st.warning("⚠️ Degraded (serving cached data): " + ", ".join(degraded))
+
 # ==============================================================================
 # 13) UI TICK (no-block)
 # ==============================================================================
@@ -664,6 +1398,10 @@ st.markdown(
 )
 if snapshot.get("error"):
     st.markdown(f"<div class='small-muted'>Snapshot error: {snapshot.get('error')}</div>", unsafe_allow_html=True)
+if snapshot.get("degraded"):
+    st.markdown("<div class='small-muted'>Snapshot degraded: yfinance circuit open, showing last cached values.</div>", unsafe_allow_html=True)
+if snapshot.get("pending"):
+    st.markdown("<div class='small-muted'>Snapshot pending: another worker is refreshing this bucket, showing previous values.</div>", unsafe_allow_html=True)
 
 for k, v in snapshot.get("data", {}).items():
     if not isinstance(v, dict) or not v.get("ok"):
@@ -681,19 +1419,35 @@ st.markdown("</div>", unsafe_allow_html=True)
 now = time.time()
 do_news_refresh = st.session_state.force_news_refresh or (now >= st.session_state.next_news_refresh_at)
 
-if do_news_refresh:
+# a fresh batch published by any session is adopted instead of refetching
+# (first view or timer tick; REFRESH NOW still fetches)
+shared, shared_at = latest_batch()
+adopt_shared = (
+    do_news_refresh and shared is not None
+    and now - shared_at < st.session_state.news_refresh_seconds
+    and (not st.session_state.batch_version or not st.session_state.force_news_refresh)
+)
+
+if adopt_shared:
+    st.session_state.force_news_refresh = False
+    st.session_state.next_news_refresh_at = shared_at + st.session_state.news_refresh_seconds
+    st.session_state.batch_version = shared.version
+    st.session_state.last_status_msg = f"Shared batch {shared.version} ({int(now - shared_at)}s old)."
+
+elif do_news_refresh:
     st.session_state.force_news_refresh = False
     st.session_state.next_news_refresh_at = now + st.session_state.news_refresh_seconds
 
     raw_items, fetch_err = fetch_latest_news(FETCH_LIMIT)
+    status_prefix = ""
     if fetch_err:
-        st.session_state.last_status_msg = f"Fetch error: {fetch_err}"
-        raw_items = []
+        # upstream down/circuit open => re-serve the newest stored items
+        raw_items = db_get_recent_news(conn, FETCH_LIMIT)
+        status_prefix = f"Fetch error: {fetch_err} (serving cached news). "
 
     if raw_items:
         current = []
-        english_texts = []
-        display_texts = []
+        raw_texts = []
         cached_scores = []
         missing_score_indices = []
 
@@ -706,97 +1460,102 @@ if do_news_refresh:
             fp = fingerprint_item(raw_ts, raw_text)
             db_upsert_news(conn, fp, raw_ts, raw_text)
 
-            en = get_or_make_translation(conn, fp, raw_text, "en")
-            disp = get_or_make_translation(conn, fp, raw_text, target_lang)
-
             sc = db_get_score(conn, fp, PROMPT_VERSION)
 
             current.append({"fp": fp, "ts": raw_ts})
-            english_texts.append(en)
-            display_texts.append(disp)
+            raw_texts.append(raw_text)
             cached_scores.append(sc)
 
+        # every configured language in one batched pass (+ "en" for scoring), so switching
+        # language in the UI is a pure read of the shared batch
+        translated = get_or_make_translations(
+            conn, [it["fp"] for it in current], raw_texts, dict.fromkeys(["en", *LANGUAGES.values()]))
+        # untranslated items are shown (and sent to the multilingual LLM) as raw text
+        texts = {lang: [t if t is not None else raw_texts[i] for i, t in enumerate(v)] for lang, v in translated.items()}
+        english_texts = texts["en"]
+
         for i in range(len(current)):
             if cached_scores[i] is None:
                 missing_score_indices.append(i)
 
         stored = 0
         if missing_score_indices:
-            results, used_model, ai_raw, ai_err = call_ai_with_fallback(english_texts, ai_lang_instruction, snapshot)
-
-            if used_model:
-                st.session_state.last_model_used = used_model
-                db_set_meta(conn, "last_ai_model", used_model)
-                db_set_meta(conn, "last_ai_at", str(int(time.time())))
-
-            res_map = {}
-            if isinstance(results, list):
-                for r in results:
-                    if isinstance(r, dict) and "id" in r:
-                        try:
-                            res_map[int(r["id"])] = r
-                        except Exception:
-                            pass
-
-            for idx in missing_score_indices:
-                fp = current[idx]["fp"]
-                r = res_map.get(idx) or (results[idx] if isinstance(results, list) and idx < len(results) and isinstance(results[idx], dict) else None)
-                if not isinstance(r, dict):
-                    continue
-
-                signal = str(r.get("signal", "SIDEWAY")).upper().strip()
-                try:
-                    score = float(r.get("score", 0.0))
-                except Exception:
-                    score = 0.0
-                reason = str(r.get("reason", "")).strip()
-
-                score = max(0.0, min(0.99, score))
-                if signal not in ("BUY", "SELL", "SIDEWAY"):
-                    signal = "SIDEWAY"
-
-                db_set_score(conn, fp, PROMPT_VERSION, used_model or "", signal, score, reason)
-                stored += 1
+            # per-fingerprint leases: each item is scored by exactly one worker
+            score_leases = {}
+            for i in missing_score_indices:
+                token = db_try_acquire_lease(conn, f"score:{PROMPT_VERSION}:{current[i]['fp']}", SCORE_LEASE_SECONDS)
+                if token:
+                    score_leases[i] = token
+            ai_err = None
+            try:
+                if score_leases:
+                    results, used_model, ai_raw, ai_err, ai_missing = call_ai_with_fallback(
+                        english_texts, ai_lang_instruction, snapshot, ids=sorted(score_leases))
+
+                    if used_model:
+                        st.session_state.last_model_used = used_model
+                        db_set_meta(conn, "last_ai_model", used_model)
+                        db_set_meta(conn, "last_ai_at", str(int(time.time())))
+
+                    # items are already validated/normalized; ids are indices into `current`
+                    for r in results:
+                        db_set_score(conn, current[r["id"]]["fp"], PROMPT_VERSION, r["model"],
+                                     r["signal"], r["score"], r["reason"])
+                        stored += 1
+            finally:
+                for i, token in score_leases.items():
+                    db_release_lease(conn, f"score:{PROMPT_VERSION}:{current[i]['fp']}", token)
+
+            # items leased by other workers: wait briefly for their scores
+            others = [i for i in missing_score_indices if i not in score_leases]
+            if others:
+                wait_for(lambda: all(db_get_score(conn, current[i]["fp"], PROMPT_VERSION) for i in others))
 
             cached_scores = [db_get_score(conn, it["fp"], PROMPT_VERSION) for it in current]
-            st.session_state.last_status_msg = f"News refreshed. Stored new AI scores: {stored}."
+            st.session_state.last_status_msg = status_prefix + f"News refreshed. Stored new AI scores: {stored}."
             if ai_err:
                 st.session_state.last_status_msg += f" (AI err: {ai_err})"
         else:
-            st.session_state.last_status_msg = "News refreshed. No new AI scoring needed."
-
-        st.session_state.current_batch = current
-        st.session_state._display_texts = display_texts
-        st.session_state._cached_scores = cached_scores
+            st.session_state.last_status_msg = status_prefix + "News refreshed. No new AI scoring needed."
+
+        # local CPU scores for whatever the LLM did not cover (LLM scores always win)
+        local_indices = [i for i in range(len(current)) if cached_scores[i] is None]
+        if local_indices and LOCAL_SCORING_ENABLED and LOCAL_AI_AVAILABLE:
+            for i in local_indices:
+                cached_scores[i] = db_get_score(conn, current[i]["fp"], LOCAL_PROMPT_VERSION)
+            # the NLI model is English-only: raw Vietnamese stand-ins wait for a real translation
+            todo = [i for i in local_indices if cached_scores[i] is None and translated["en"][i] is not None]
+            waiting = sum(1 for i in local_indices if cached_scores[i] is None) - len(todo)
+            if waiting:
+                st.session_state.last_status_msg += f" Local: {waiting} waiting for English translation."
+            if todo:
+                local_results, local_model, local_err = score_local([english_texts[i] for i in todo])
+                for r in local_results:
+                    i = todo[r["id"]]
+                    db_set_score(conn, current[i]["fp"], LOCAL_PROMPT_VERSION, local_model,
+                                 r["signal"], r["score"], r["reason"])
+                    cached_scores[i] = db_get_score(conn, current[i]["fp"], LOCAL_PROMPT_VERSION)
+                st.session_state.last_status_msg += f" Local scores: {len(local_results)}."
+                if local_err:
+                    st.session_state.last_status_msg += f" (Local err: {local_err})"
+                if local_results and not st.session_state.last_model_used:
+                    st.session_state.last_model_used = LOCAL_MODEL_TAG
+
+        st.session_state.batch_version = publish_batch(make_batch(current, texts, cached_scores))
 
     else:
-        st.session_state.current_batch = []
-        st.session_state._display_texts = []
-        st.session_state._cached_scores = []
-        st.session_state.last_status_msg = "News refreshed. No news returned."
+        st.session_state.batch_version = ""
+        st.session_state.last_status_msg = status_prefix + "News refreshed. No news returned."
 
 # ==============================================================================
 # 16) RENDER dashboard + list
 # ==============================================================================
 st.caption(st.session_state.get("last_status_msg", ""))
 
-current_batch = st.session_state.get("current_batch") or []
-display_texts = st.session_state.get("_display_texts") or []
-cached_scores = st.session_state.get("_cached_scores") or []
+batch = get_batch(st.session_state.batch_version) if st.session_state.batch_version else None
 
-if current_batch and display_texts and cached_scores and len(current_batch) == len(display_texts) == len(cached_scores):
-    buy_sell_scores = []
-    for sc in cached_scores:
-        if not sc:
-            continue
-        sig = (sc.get("signal") or "SIDEWAY").upper()
-        s = float(sc.get("score") or 0.0)
-        if sig == "BUY" and s > 0:
-            buy_sell_scores.append(+s)
-        elif sig == "SELL" and s > 0:
-            buy_sell_scores.append(-s)
-
-    avg = statistics.mean(buy_sell_scores) if buy_sell_scores else 0.0
+if batch is not None and len(batch):
+    avg = batch.avg
     if avg > 0.15:
         trend, tcolor = "LONG / BUY XAUUSD 📈", "#10B981"
         msg = "Bias BUY (macro rules incl. Fed/Inflation/Risk-off) + snapshot if available"
@@ -823,11 +1582,9 @@ if current_batch and display_texts and cached_scores and len(current_batch) == l
         unsafe_allow_html=True,
     )
 
-    for i, item in enumerate(current_batch):
-        sc = cached_scores[i]
-        sig = (sc.get("signal") if sc else "SIDEWAY").upper() if sc else "SIDEWAY"
-        score = float(sc.get("score") or 0.0) if sc else 0.0
-        reason = sc.get("reason") if sc else ""
+    display_texts = batch.texts.get(target_lang) or batch.texts["en"]
+    for i in range(len(batch)):
+        sig, score, reason = batch.signals[i], batch.scores[i], batch.reasons[i]
 
         if sig == "BUY" and score > 0:
             color, label = "#10B981", "BUY XAU"
@@ -838,7 +1595,7 @@ if current_batch and display_texts and cached_scores and len(current_batch) == l
             label = "SIDEWAY"
 
         try:
-            t_str = datetime.datetime.fromtimestamp(item["ts"], CURRENT_TZ).strftime("%H:%M")
+            t_str = batch.times[sel_tz][i]
         except Exception:
             t_str = "--:--"
 
@@ -871,3 +1628,12 @@ st.markdown(
     """,
     unsafe_allow_html=True,
 )
+
+# ==============================================================================
+# 18) MAINTENANCE (after render; retention gated by interval, vacuum in small steps)
+# ==============================================================================
+try:
+    maybe_run_retention(conn)
+    db_incremental_vacuum_step(conn)
+except Exception:
+    pass
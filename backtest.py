@@ -0,0 +1,220 @@
+import os
+import json
+import sqlite3
+import argparse
+import numpy as np
+
+# Replay stored news scores against stored M15 bars (written by app.py into xau_cache.sqlite3)
+# and report hit rates / forward returns of the dashboard signal.
+#
+#   python backtest.py --thresholds 0.05,0.10,0.15,0.20 --horizons 1,4,16
+#
+# Signal = same aggregate as the dashboard: mean of signed BUY/SELL scores (score > 0)
+# over the latest FETCH_LIMIT news items visible at each M15 bar close.
+
+# ==============================================================================
+# 0) CONFIG (mirrors app.py)
+# ==============================================================================
+DB_PATH = os.environ.get("XAU_DB_PATH", "xau_cache.sqlite3")
+FETCH_LIMIT = 20
+SIGNAL_THRESHOLD = 0.15
+GOLD_TICKER = "GC=F"
+M15_SECONDS = 900
+STREAM_CHUNK_ROWS = 10000
+
+# ==============================================================================
+# 1) LOAD (streamed in source_ts / bar order)
+# ==============================================================================
+def list_prompt_versions(conn) -> list[str]:
+    cur = conn.cursor()
+    cur.execute("SELECT prompt_version, COUNT(*) FROM scores GROUP BY prompt_version ORDER BY prompt_version")
+    return [r[0] for r in cur.fetchall()]
+
+def load_news_signals(conn, prompt_version: str, chunk_rows: int = STREAM_CHUNK_ROWS):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT n.source_ts, s.signal, s.score
+        FROM news n
+        LEFT JOIN scores s ON s.fp = n.fp AND s.prompt_version = ?
+        WHERE n.source_ts > 0
+        ORDER BY n.source_ts
+    """, (prompt_version,))
+    ts_parts, signed_parts, scored_parts = [], [], []
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        sig = np.array([(r[1] or "").upper() for r in rows])
+        score = np.fromiter((float(r[2] or 0.0) for r in rows), dtype=np.float64, count=len(rows))
+        sign = np.where(sig == "BUY", 1.0, np.where(sig == "SELL", -1.0, 0.0))
+        ts_parts.append(ts)
+        signed_parts.append(sign * np.clip(score, 0.0, 0.99))
+        scored_parts.append(sig != "")
+    if not ts_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=bool)
+    return np.concatenate(ts_parts), np.concatenate(signed_parts), np.concatenate(scored_parts)
+
+def load_bars(conn, ticker: str = GOLD_TICKER, chunk_rows: int = STREAM_CHUNK_ROWS):
+    cur = conn.cursor()
+    cur.execute("SELECT ts, close FROM bars WHERE ticker=? AND close > 0 ORDER BY ts", (ticker,))
+    ts_parts, close_parts = [], []
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        arr = np.array(rows, dtype=np.float64)
+        ts_parts.append(arr[:, 0].astype(np.int64))
+        close_parts.append(arr[:, 1])
+    if not ts_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(ts_parts), np.concatenate(close_parts)
+
+# ==============================================================================
+# 2) SIGNAL + RETURNS (vectorized)
+# ==============================================================================
+def rolling_batch_signal(signed: np.ndarray, window: int = FETCH_LIMIT) -> np.ndarray:
+    # avg of nonzero signed scores over the last `window` items, 0.0 when none (dashboard rule)
+    n = len(signed)
+    nonzero = (signed != 0).astype(np.float64)
+    cs = np.concatenate([[0.0], np.cumsum(signed)])
+    cn = np.concatenate([[0.0], np.cumsum(nonzero)])
+    hi = np.arange(1, n + 1)
+    lo = np.maximum(0, hi - int(window))
+    sums = cs[hi] - cs[lo]
+    counts = cn[hi] - cn[lo]
+    return np.divide(sums, counts, out=np.zeros(n), where=counts > 0)
+
+def signal_at_bars(news_ts: np.ndarray, agg: np.ndarray, bar_ts: np.ndarray, max_news_age_seconds: int = 0):
+    # signal known at each bar close: latest news with source_ts <= bar close (no lookahead)
+    bar_close = bar_ts + M15_SECONDS
+    j = np.searchsorted(news_ts, bar_close, side="right") - 1
+    valid = j >= 0
+    jj = np.clip(j, 0, None)
+    if max_news_age_seconds > 0 and len(news_ts):
+        valid &= (bar_close - news_ts[jj]) <= max_news_age_seconds
+    out = np.where(valid, agg[jj] if len(agg) else 0.0, np.nan)
+    return out
+
+def forward_returns(close: np.ndarray, horizon: int) -> np.ndarray:
+    fwd = np.full(len(close), np.nan)
+    if 0 < horizon < len(close):
+        fwd[:-horizon] = close[horizon:] / close[:-horizon] - 1.0
+    return fwd
+
+def evaluate(sig: np.ndarray, fwd: np.ndarray, thresholds) -> list[dict]:
+    thr = np.asarray(thresholds, dtype=np.float64)[:, None]       # (T, 1)
+    ok = np.isfinite(sig) & np.isfinite(fwd)                      # (N,)
+    s = np.where(ok, sig, 0.0)[None, :]
+    f = np.where(ok, fwd, 0.0)[None, :]
+    direction = np.where(s > thr, 1.0, np.where(s < -thr, -1.0, 0.0))   # (T, N)
+    active = direction != 0
+    n_trades = active.sum(axis=1)
+    hits = (active & (np.sign(f) == direction)).sum(axis=1)
+    pnl = (direction * f).sum(axis=1)
+    longs = direction > 0
+    shorts = direction < 0
+    n_long = longs.sum(axis=1)
+    n_short = shorts.sum(axis=1)
+
+    def _div(a, b):
+        return np.divide(a, b, out=np.full(a.shape, np.nan), where=b > 0)
+
+    hit_rate = _div(hits.astype(np.float64), n_trades)
+    mean_ret = _div(pnl, n_trades)
+    long_ret = _div((f * longs).sum(axis=1), n_long)
+    short_ret = _div((f * shorts).sum(axis=1), n_short)
+    base_ret = float(f[0, ok].mean()) if ok.any() else float("nan")
+
+    rows = []
+    for i, t in enumerate(thr[:, 0]):
+        rows.append({
+            "threshold": float(t),
+            "bars": int(ok.sum()),
+            "trades": int(n_trades[i]),
+            "long": int(n_long[i]),
+            "short": int(n_short[i]),
+            "hit_rate": float(hit_rate[i]),
+            "mean_ret_bps": float(mean_ret[i] * 1e4),
+            "long_fwd_bps": float(long_ret[i] * 1e4),
+            "short_fwd_bps": float(short_ret[i] * 1e4),
+            "all_bars_fwd_bps": base_ret * 1e4,
+        })
+    return rows
+
+# ==============================================================================
+# 3) RUN
+# ==============================================================================
+def run_backtest(conn, prompt_versions=None, thresholds=(SIGNAL_THRESHOLD,), horizons=(1, 4, 16),
+                 ticker: str = GOLD_TICKER, window: int = FETCH_LIMIT, max_news_age_seconds: int = 0) -> dict:
+    bar_ts, close = load_bars(conn, ticker)
+    versions = list(prompt_versions or list_prompt_versions(conn))
+    report = {"ticker": ticker, "bars": int(len(bar_ts)), "window": int(window), "versions": {}}
+    if not len(bar_ts):
+        report["error"] = f"no stored bars for {ticker}"
+        return report
+
+    fwd_by_h = {int(h): forward_returns(close, int(h)) for h in horizons}
+    for pv in versions:
+        news_ts, signed, scored = load_news_signals(conn, pv)
+        agg = rolling_batch_signal(signed, window)
+        sig = signal_at_bars(news_ts, agg, bar_ts, max_news_age_seconds)
+        report["versions"][pv] = {
+            "news": int(len(news_ts)),
+            "scored": int(scored.sum()),
+            "horizons": {h: evaluate(sig, fwd, thresholds) for h, fwd in fwd_by_h.items()},
+        }
+    return report
+
+def format_report(report: dict) -> str:
+    lines = [f"ticker={report['ticker']} bars={report['bars']} window={report['window']}"]
+    if report.get("error"):
+        lines.append(f"error: {report['error']}")
+    hdr = f"{'thr':>6} {'bars':>7} {'trades':>7} {'L/S':>11} {'hit%':>6} {'ret bps':>8} {'long bps':>9} {'short bps':>9} {'all bps':>8}"
+    for pv, v in report["versions"].items():
+        lines.append("")
+        lines.append(f"== {pv}  (news={v['news']} scored={v['scored']})")
+        for h, rows in v["horizons"].items():
+            lines.append(f"-- horizon {h} x M15")
+            lines.append(hdr)
+            for r in rows:
+                lines.append(
+                    f"{r['threshold']:>6.2f} {r['bars']:>7} {r['trades']:>7} {str(r['long']) + '/' + str(r['short']):>11} "
+                    f"{r['hit_rate'] * 100:>6.1f} {r['mean_ret_bps']:>8.2f} {r['long_fwd_bps']:>9.2f} "
+                    f"{r['short_fwd_bps']:>9.2f} {r['all_bars_fwd_bps']:>8.2f}"
+                )
+    return "\n".join(lines)
+
+def _float_list(s: str):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Backtest stored XAU news scores against stored M15 bars.")
+    p.add_argument("--db", default=DB_PATH)
+    p.add_argument("--prompt-version", action="append", dest="prompt_versions",
+                   help="repeatable; default: every version present in scores")
+    p.add_argument("--ticker", default=GOLD_TICKER)
+    p.add_argument("--thresholds", default="0.05,0.10,0.15,0.20,0.25")
+    p.add_argument("--horizons", default="1,4,16", help="forward horizons in M15 bars")
+    p.add_argument("--window", type=int, default=FETCH_LIMIT, help="news items per aggregate (dashboard batch)")
+    p.add_argument("--max-news-age-minutes", type=int, default=0, help="drop bars whose latest news is older (0=off)")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        report = run_backtest(
+            conn,
+            prompt_versions=args.prompt_versions,
+            thresholds=_float_list(args.thresholds),
+            horizons=[int(h) for h in _float_list(args.horizons)],
+            ticker=args.ticker,
+            window=args.window,
+            max_news_age_seconds=args.max_news_age_minutes * 60,
+        )
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+if __name__ == "__main__":
+    main()
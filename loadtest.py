@@ -0,0 +1,533 @@
+import os
+import re
+import sys
+import json
+import time
+import types
+import sqlite3
+import argparse
+import tempfile
+import threading
+import statistics
+import concurrent.futures
+from unittest import mock
+
+import requests
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+# private streamlit internals patched in shared_runtime_patches(); checked at startup
+# (require_streamlit_internals) since requirements.txt does not pin streamlit
+TESTED_STREAMLIT_VERSION = "1.66.0"
+try:
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test as _app_test
+    _STREAMLIT_IMPORT_ERROR = None
+except ImportError as e:
+    _STREAMLIT_IMPORT_ERROR = e
+
+# Load test: drive app.py (headless, streamlit AppTest) for N simulated sessions against
+# local fake upstreams (vnwallstreet, Google Translate, yfinance, Cerebras).
+#
+#   python loadtest.py --sessions 1,5,10,25 --ticks 6 --refresh-every 3
+#
+# Each tick reruns every session concurrently (= one autorefresh tick). Every `--refresh-every`
+# ticks the news refresh is due: `--mode timer` lets the app adopt a shared fresh batch,
+# `--mode button` forces a fetch per session (REFRESH NOW worst case).
+#
+#   python loadtest.py --outage vnwallstreet,google_translate,cerebras
+#
+# Outage check: one session on a fake clock, refreshing news at the app's default cadence while
+# one upstream hangs for --outage-timeout then fails; shows the breaker state and the time each
+# refresh spends on the dead upstream. Exits non-zero if a breaker never opens.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# ==============================================================================
+# 1) METRICS
+# ==============================================================================
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.upstream = {"vnwallstreet": 0, "google_translate": 0, "yfinance": 0, "cerebras": 0}
+            self.sqlite_calls = 0
+            self.sqlite_seconds = 0.0
+            self.sqlite_max_call = 0.0
+            self.sqlite_locked = 0
+            self.lock_waits = 0
+            self.lock_wait_seconds = 0.0
+            self.lock_wait_max = 0.0
+
+    def hit(self, name: str):
+        with self._lock:
+            self.upstream[name] = self.upstream.get(name, 0) + 1
+
+    def sqlite(self, seconds: float, locked: bool = False):
+        with self._lock:
+            self.sqlite_calls += 1
+            self.sqlite_seconds += seconds
+            self.sqlite_max_call = max(self.sqlite_max_call, seconds)
+            self.sqlite_locked += int(locked)
+
+    def lock_wait(self, seconds: float):
+        with self._lock:
+            self.lock_waits += 1
+            self.lock_wait_seconds += seconds
+            self.lock_wait_max = max(self.lock_wait_max, seconds)
+
+METRICS = Metrics()
+
+def _timed_sqlite(fn, *a, **k):
+    t0 = time.perf_counter()
+    locked = False
+    try:
+        return fn(*a, **k)
+    except sqlite3.OperationalError as e:
+        locked = "locked" in str(e) or "busy" in str(e)
+        raise
+    finally:
+        METRICS.sqlite(time.perf_counter() - t0, locked)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, *a, **k):
+        return _timed_sqlite(super().execute, *a, **k)
+
+    def executemany(self, *a, **k):
+        return _timed_sqlite(super().executemany, *a, **k)
+
+class TimedConnection(sqlite3.Connection):
+    # time spent in execute/commit ~= work + SQLite file-lock waits (busy timeout); waiting for
+    # the app's DB lock happens before execute and is timed by TimedRLock
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *a, **k):
+        return _timed_sqlite(super().execute, *a, **k)
+
+    def executescript(self, *a, **k):
+        return _timed_sqlite(super().executescript, *a, **k)
+
+    def commit(self):
+        return _timed_sqlite(super().commit)
+
+class TimedRLock:
+    # wraps the RLock of app.py's _db_lock(); only contended acquisitions wait (and are counted)
+    def __init__(self, lock):
+        self._lock = lock
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        t0 = time.perf_counter()
+        try:
+            return self._lock.acquire(True, timeout)
+        finally:
+            METRICS.lock_wait(time.perf_counter() - t0)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except Exception:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def pct(values, p: float) -> float:
+    if not values:
+        return float("nan")
+    v = sorted(values)
+    k = min(len(v) - 1, max(0, int(round(p / 100.0 * (len(v) - 1)))))
+    return v[k]
+
+# ==============================================================================
+# 2) FAKE UPSTREAMS
+# ==============================================================================
+class FakeUpstreams:
+    def __init__(self, latency: float = 0.05, ai_latency: float = 0.5, churn: int = 3, limit: int = 20,
+                 outage_timeout: float = 10.0):
+        self.latency = float(latency)
+        self.ai_latency = float(ai_latency)
+        self.churn = int(churn)
+        self.limit = int(limit)
+        self.outage_timeout = float(outage_timeout)
+        self.down = set()  # upstream names that hang for outage_timeout, then fail
+        self._lock = threading.Lock()
+        self._head = 1000
+
+    def _call(self, name: str, latency: float):
+        METRICS.hit(name)
+        if name in self.down:
+            time.sleep(self.outage_timeout)
+            raise requests.exceptions.ConnectionError(f"{name}: fake outage")
+        time.sleep(latency)
+
+    # --- vnwallstreet -------------------------------------------------------
+    def requests_get(self, url, params=None, headers=None, timeout=None, **kw):
+        self._call("vnwallstreet", self.latency)
+        with self._lock:
+            self._head += self.churn
+            head = self._head
+        now_ms = int(time.time() * 1000)
+        data = [
+            {"createtime": now_ms - (head - n) * 60000, "title": f"Tin nhanh số {n}: Fed, lợi suất và vàng"}
+            for n in range(head, head - self.limit, -1)
+        ]
+        resp = requests.models.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({"data": data}).encode("utf-8")
+        return resp
+
+    # --- google translate ---------------------------------------------------
+    def translator_cls(self):
+        up = self
+
+        class FakeGoogleTranslator:
+            def __init__(self, source="auto", target="en", **kw):
+                self.target = target
+
+            def translate(self, text):
+                up._call("google_translate", up.latency)
+                # per line, keeping the "[k] " item markers of batched requests (as Google does)
+                return re.sub(r"(?m)^(\[\d+\] )?", lambda m: f"{m.group(0)}[{self.target}] ", text)
+
+            def translate_batch(self, batch):
+                return [self.translate(t) for t in batch]
+
+        return FakeGoogleTranslator
+
+    # --- yfinance -----------------------------------------------------------
+    def yf_download(self, tickers=None, period=None, interval=None, **kw):
+        import pandas as pd
+        self._call("yfinance", self.latency)
+        idx = pd.date_range(end=pd.Timestamp.utcnow().floor("15min"), periods=8, freq="15min")
+        return pd.DataFrame({"Close": [100.0 + i * 0.1 for i in range(len(idx))]}, index=idx)
+
+    # --- cerebras -----------------------------------------------------------
+    def cerebras_cls(self):
+        up = self
+
+        class _Completions:
+            def create(self, model=None, messages=None, **kw):
+                up._call("cerebras", up.ai_latency)
+                ids = re.findall(r"^ID (\d+):", messages[-1]["content"], flags=re.M)
+                arr = [{"id": int(i), "signal": "BUY", "score": 0.3, "reason": "fake"} for i in ids]
+                msg = types.SimpleNamespace(content=json.dumps(arr))
+                return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)])
+
+        class FakeCerebras:
+            def __init__(self, api_key=None, **kw):
+                self.chat = types.SimpleNamespace(completions=_Completions())
+
+        return FakeCerebras
+
+    def install(self):
+        # fake modules for the app's upstream imports + patched requests.get, timed sqlite3.connect
+        # and threading.RLock (only the one created in app.py's _db_lock is wrapped)
+        dt = types.ModuleType("deep_translator")
+        dt.GoogleTranslator = self.translator_cls()
+        yf = types.ModuleType("yfinance")
+        yf.download = self.yf_download
+        sdk = types.ModuleType("cerebras.cloud.sdk")
+        sdk.Cerebras = self.cerebras_cls()
+        cerebras = types.ModuleType("cerebras")
+        cloud = types.ModuleType("cerebras.cloud")
+        cerebras.cloud, cloud.sdk = cloud, sdk
+        modules = {
+            "deep_translator": dt, "yfinance": yf,
+            "cerebras": cerebras, "cerebras.cloud": cloud, "cerebras.cloud.sdk": sdk,
+        }
+        real_connect = sqlite3.connect
+
+        def connect(*a, **k):
+            k.setdefault("factory", TimedConnection)
+            return real_connect(*a, **k)
+
+        real_rlock = threading.RLock
+
+        def rlock(*a, **k):
+            lock = real_rlock(*a, **k)
+            code = sys._getframe(1).f_code
+            if code.co_name == "_db_lock" and os.path.abspath(code.co_filename) == APP_PATH:
+                return TimedRLock(lock)
+            return lock
+
+        return [
+            mock.patch.dict(sys.modules, modules),
+            mock.patch("requests.get", self.requests_get),
+            mock.patch("sqlite3.connect", connect),
+            mock.patch("threading.RLock", rlock),
+            mock.patch.dict(os.environ, {"CEREBRAS_API_KEY": "loadtest", "VNWALLSTREET_SECRET_KEY": "loadtest"}),
+        ]
+
+class FakeClock:
+    # time.time/time.sleep as seen from app.py and this file: sleeps advance the clock instead of
+    # blocking, so minutes of timeouts, backoff and refresh cadence run in milliseconds
+    def __init__(self):
+        self.offset = 0.0
+        self._files = {APP_PATH, os.path.abspath(__file__)}
+        self._real_time, self._real_sleep = time.time, time.sleep
+        self._lock = threading.Lock()
+
+    def _faked(self) -> bool:
+        return os.path.abspath(sys._getframe(2).f_code.co_filename) in self._files
+
+    def time(self) -> float:
+        return self._real_time() + (self.offset if self._faked() else 0.0)
+
+    def sleep(self, seconds: float):
+        if not self._faked():
+            return self._real_sleep(seconds)
+        with self._lock:
+            self.offset += max(0.0, float(seconds))
+
+    def install(self):
+        return [mock.patch("time.time", self.time), mock.patch("time.sleep", self.sleep)]
+
+# ==============================================================================
+# 3) RUN
+# ==============================================================================
+class _AppTestRuntimeSlot:
+    # AppTest sets/clears the global Runtime around every run; concurrent runs would tear
+    # each other's runtime down, so it writes here and one shared runtime serves all sessions
+    _instance = None
+
+def require_streamlit_internals():
+    missing = [str(_STREAMLIT_IMPORT_ERROR)] if _STREAMLIT_IMPORT_ERROR else []
+    if not missing:
+        for obj, attr, label in (
+            (_app_test, "Runtime", "streamlit.testing.v1.app_test.Runtime"),
+            (Runtime, "_instance", "streamlit.runtime.Runtime._instance"),
+            (ScriptCache, "get_bytecode", "ScriptCache.get_bytecode"),
+        ):
+            if not hasattr(obj, attr):
+                missing.append(f"missing {label}")
+    if missing:
+        raise SystemExit(
+            f"loadtest.py relies on streamlit internals that changed in streamlit {st.__version__} "
+            f"(tested with {TESTED_STREAMLIT_VERSION}): {'; '.join(missing)}. "
+            f"Run it with pip install streamlit=={TESTED_STREAMLIT_VERSION}."
+        )
+
+def shared_runtime_patches():
+    rt = mock.MagicMock(spec=Runtime)
+    rt.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    rt.cache_storage_manager = MemoryCacheStorageManager()
+
+    # AppTest builds a ScriptCache per run; a server compiles once. Share the bytecode
+    # (also avoids concurrent ast.parse, which is not thread-safe on CPython 3.11)
+    real_get_bytecode = ScriptCache.get_bytecode
+    lock, compiled = threading.Lock(), {}
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = real_get_bytecode(self, script_path)
+            return compiled[script_path]
+
+    return [
+        mock.patch.object(_app_test, "Runtime", _AppTestRuntimeSlot),
+        mock.patch.object(Runtime, "_instance", rt),
+        mock.patch.object(ScriptCache, "get_bytecode", get_bytecode),
+    ]
+
+def new_session(timeout: float) -> AppTest:
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state["yf_delay"] = 0.0
+    return at
+
+def rerun(at: AppTest, due: bool, mode: str):
+    if due:
+        at.session_state["next_news_refresh_at"] = 0.0
+        if mode == "button":
+            at.session_state["force_news_refresh"] = True
+    t0 = time.perf_counter()
+    at.run()
+    return time.perf_counter() - t0, len(at.exception)
+
+def run_level(n_sessions: int, ticks: int, refresh_every: int, mode: str, timeout: float, db_dir: str) -> dict:
+    os.environ["XAU_DB_PATH"] = os.path.join(db_dir, f"load_{n_sessions}_{time.time_ns()}.sqlite3")
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    METRICS.reset()
+    rss_before = rss_mb()
+
+    sessions = [new_session(timeout) for _ in range(n_sessions)]
+    latencies, errors = [], 0
+    first_latencies = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_sessions) as pool:
+        for tick in range(ticks):
+            due = tick > 0 and refresh_every > 0 and tick % refresh_every == 0
+            for dt, n_exc in pool.map(lambda at: rerun(at, due, mode), sessions):
+                (first_latencies if tick == 0 else latencies).append(dt)
+                errors += n_exc
+    rss_after = rss_mb()
+
+    all_lat = first_latencies + latencies
+    reruns = len(all_lat)
+    return {
+        "sessions": n_sessions,
+        "reruns": reruns,
+        "errors": errors,
+        "first_load_p50_ms": pct(first_latencies, 50) * 1e3,
+        "tick_p50_ms": pct(latencies, 50) * 1e3,
+        "tick_p95_ms": pct(latencies, 95) * 1e3,
+        "tick_p99_ms": pct(latencies, 99) * 1e3,
+        "max_ms": max(all_lat) * 1e3 if all_lat else float("nan"),
+        "mean_ms": statistics.mean(all_lat) * 1e3 if all_lat else float("nan"),
+        "sqlite_ms_per_rerun": METRICS.sqlite_seconds / max(1, reruns) * 1e3,
+        "sqlite_max_call_ms": METRICS.sqlite_max_call * 1e3,
+        "sqlite_locked": METRICS.sqlite_locked,
+        "db_lock_wait_ms_per_rerun": METRICS.lock_wait_seconds / max(1, reruns) * 1e3,
+        "db_lock_wait_max_ms": METRICS.lock_wait_max * 1e3,
+        "db_lock_contended": METRICS.lock_waits,
+        "upstream": dict(METRICS.upstream),
+        "rss_mb": rss_after,
+        "rss_delta_per_session_mb": (rss_after - rss_before) / max(1, n_sessions),
+    }
+
+DEGRADED_RE = re.compile(r"([\w.:-]+) \((open|half_open)\)")
+
+def run_outage(upstream: str, refreshes: int, up: FakeUpstreams, clock: FakeClock, timeout: float, db_dir: str) -> list:
+    # healthy first load, then `upstream` down for `refreshes` news refreshes at the app's own cadence
+    os.environ["XAU_DB_PATH"] = os.path.join(db_dir, f"outage_{upstream}_{time.time_ns()}.sqlite3")
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    up.down = set()
+    at = new_session(timeout)
+    at.run()
+    up.down = {upstream}
+    rows = []
+    try:
+        for _ in range(3 * refreshes):
+            if len(rows) == refreshes:
+                break
+            clock.offset += max(0.0, at.session_state["next_news_refresh_at"] - clock.time())
+            calls, t0 = METRICS.upstream[upstream], clock.time()
+            at.run()
+            if at.session_state["last_status_msg"].startswith("Shared batch"):
+                continue  # adopted its own batch (timer tick right after a slow refresh)
+            # the degraded banner is rendered before the refresh: breaker state as this refresh found it
+            states = {name: state for w in at.warning for name, state in DEGRADED_RE.findall(w.value)}
+            rows.append({
+                "upstream": upstream,
+                "refresh": len(rows) + 1,
+                "breakers": {k: v for k, v in states.items() if k.split(":")[0] == upstream},
+                "calls": METRICS.upstream[upstream] - calls,
+                "seconds": clock.time() - t0,
+                "errors": len(at.exception),
+            })
+    finally:
+        up.down = set()
+    return rows
+
+def format_outage(rows) -> str:
+    lines = [f"{'upstream':<17} {'refresh':>7} {'calls':>5} {'spent_s':>8} {'err':>4}  breakers at start"]
+    for r in rows:
+        br = ", ".join(f"{k}={v}" for k, v in sorted(r["breakers"].items())) or "closed"
+        lines.append(f"{r['upstream']:<17} {r['refresh']:>7} {r['calls']:>5} {r['seconds']:>8.1f} {r['errors']:>4}  {br}")
+    return "\n".join(lines)
+
+def format_rows(rows) -> str:
+    hdr = (f"{'sess':>5} {'reruns':>6} {'err':>4} {'first50':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+           f"{'sql/run':>8} {'sqlmax':>8} {'busy':>5} {'lkw/run':>8} {'lkmax':>8} {'vnw':>5} {'gtr':>5} {'yf':>4} {'llm':>5} {'rssMB':>7} {'dRSS/s':>7}")
+    lines = [hdr]
+    for r in rows:
+        u = r["upstream"]
+        lines.append(
+            f"{r['sessions']:>5} {r['reruns']:>6} {r['errors']:>4} {r['first_load_p50_ms']:>8.1f} "
+            f"{r['tick_p50_ms']:>8.1f} {r['tick_p95_ms']:>8.1f} {r['tick_p99_ms']:>8.1f} {r['max_ms']:>8.1f} "
+            f"{r['sqlite_ms_per_rerun']:>8.2f} {r['sqlite_max_call_ms']:>8.2f} {r['sqlite_locked']:>5} "
+            f"{r['db_lock_wait_ms_per_rerun']:>8.2f} {r['db_lock_wait_max_ms']:>8.2f} "
+            f"{u['vnwallstreet']:>5} {u['google_translate']:>5} {u['yfinance']:>4} {u['cerebras']:>5} "
+            f"{r['rss_mb']:>7.1f} {r['rss_delta_per_session_mb']:>7.2f}"
+        )
+    lines.append("(latencies in ms; sql/run = time inside SQLite execute/commit per rerun, busy = SQLITE_BUSY/locked "
+                 "errors; lkw/run, lkmax = waiting for the app's process-wide DB lock, not included in sql/run)")
+    return "\n".join(lines)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Simulate many concurrent dashboard sessions against fake upstreams.")
+    p.add_argument("--sessions", default="1,5,10,25", help="comma list of concurrent session counts")
+    p.add_argument("--ticks", type=int, default=6, help="reruns per session (first = initial load)")
+    p.add_argument("--refresh-every", type=int, default=3, help="news refresh due every N ticks (0=never)")
+    p.add_argument("--mode", choices=["timer", "button"], default="timer")
+    p.add_argument("--latency", type=float, default=0.05, help="fake HTTP/translate/yfinance latency (s)")
+    p.add_argument("--ai-latency", type=float, default=0.5, help="fake LLM latency (s)")
+    p.add_argument("--churn", type=int, default=3, help="new news items per vnwallstreet fetch")
+    p.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (s)")
+    p.add_argument("--outage", default="", help="comma list of upstreams to take down one at a time "
+                   "(vnwallstreet, google_translate, cerebras); runs the outage check instead")
+    p.add_argument("--outage-refreshes", type=int, default=8, help="news refreshes per outage")
+    p.add_argument("--outage-timeout", type=float, default=10.0, help="time a dead upstream hangs before failing (s)")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    require_streamlit_internals()
+    up = FakeUpstreams(latency=args.latency, ai_latency=args.ai_latency, churn=args.churn,
+                       outage_timeout=args.outage_timeout)
+    patches = up.install() + shared_runtime_patches()
+    if args.outage:
+        return run_outage_check(args, up, patches)
+    rows = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for ptc in patches:
+            ptc.start()
+        try:
+            # warm-up (imports, bytecode, schema) so it does not land in the first level
+            run_level(1, 1, 0, args.mode, args.timeout, db_dir)
+            for n in [int(x) for x in args.sessions.split(",") if x.strip()]:
+                rows.append(run_level(n, args.ticks, args.refresh_every, args.mode, args.timeout, db_dir))
+                if not args.json:
+                    print(format_rows(rows[-1:]).splitlines()[1], flush=True)
+        finally:
+            for ptc in reversed(patches):
+                ptc.stop()
+    print(json.dumps(rows, indent=2) if args.json else format_rows(rows))
+
+def run_outage_check(args, up: FakeUpstreams, patches) -> int:
+    clock = FakeClock()
+    patches = patches + clock.install()
+    rows, never_opened = [], []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for ptc in patches:
+            ptc.start()
+        try:
+            for upstream in [x.strip() for x in args.outage.split(",") if x.strip()]:
+                got = run_outage(upstream, args.outage_refreshes, up, clock, args.timeout, db_dir)
+                if not any(r["breakers"] for r in got):
+                    never_opened.append(upstream)
+                rows += got
+        finally:
+            for ptc in reversed(patches):
+                ptc.stop()
+    print(json.dumps(rows, indent=2) if args.json else format_outage(rows))
+    if never_opened:
+        print(f"FAIL: breaker never opened for {', '.join(never_opened)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import os
+import shutil
+import sqlite3
+import argparse
+
+# Offline maintenance for the dashboard, run outside the app: these steps are too slow (or need
+# the network) to run inside a render without blocking every viewer.
+#
+#   python maintenance.py --enable-incremental-vacuum
+#   python maintenance.py --fetch-local-model [--model-dir models/nli]
+#
+# --enable-incremental-vacuum: one full VACUUM that switches an existing DB to
+# auto_vacuum=INCREMENTAL (new DBs get it from app.py directly); afterwards the app
+# releases free pages in small steps per rerun.
+# --fetch-local-model: download the local scoring model (app.py only loads it from disk)
+# into the HF cache, or into --model-dir (then set XAU_LOCAL_MODEL_PATH to that dir).
+
+# ==============================================================================
+# 0) CONFIG (mirrors app.py)
+# ==============================================================================
+DB_PATH = os.environ.get("XAU_DB_PATH", "xau_cache.sqlite3")
+BUSY_TIMEOUT_SECONDS = 30
+VACUUM_FREE_SPACE_FACTOR = 2.0  # VACUUM writes a full copy (plus WAL) next to the DB
+LOCAL_MODEL_NAME = "typeform/distilbert-base-uncased-mnli"
+
+# ==============================================================================
+# 1) STEPS
+# ==============================================================================
+def db_size_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+def enable_incremental_vacuum(conn, path: str) -> dict:
+    cur = conn.cursor()
+    cur.execute("PRAGMA auto_vacuum")
+    before = int(cur.fetchone()[0])
+    if before == 2:
+        return {"auto_vacuum": before, "changed": False, "size_before": db_size_bytes(path)}
+
+    size_before = db_size_bytes(path)
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+    if free < size_before * VACUUM_FREE_SPACE_FACTOR:
+        raise RuntimeError(f"not enough free disk space for VACUUM: {free} bytes free, DB is {size_before} bytes")
+
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cur.execute("VACUUM")
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    cur.execute("PRAGMA auto_vacuum")
+    return {
+        "auto_vacuum": int(cur.fetchone()[0]),
+        "changed": True,
+        "size_before": size_before,
+        "size_after": db_size_bytes(path),
+    }
+
+def fetch_local_model(model_name: str = LOCAL_MODEL_NAME, model_dir: str = "") -> dict:
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    tok = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    if model_dir:
+        tok.save_pretrained(model_dir)
+        model.save_pretrained(model_dir)
+    return {"model": model_name, "saved_to": model_dir or "HF cache", "labels": model.config.id2label}
+
+# ==============================================================================
+# 2) RUN
+# ==============================================================================
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Offline maintenance for the XAU dashboard (SQLite cache, local model).")
+    p.add_argument("--db", default=DB_PATH)
+    p.add_argument("--enable-incremental-vacuum", action="store_true",
+                   help="switch an existing DB to auto_vacuum=INCREMENTAL (full VACUUM; app must be stopped)")
+    p.add_argument("--fetch-local-model", action="store_true", help="download the local scoring model")
+    p.add_argument("--model-name", default=LOCAL_MODEL_NAME)
+    p.add_argument("--model-dir", default="", help="save the model here instead of only the HF cache")
+    args = p.parse_args(argv)
+
+    if not (args.enable_incremental_vacuum or args.fetch_local_model):
+        p.error("nothing to do (see --help)")
+
+    if args.enable_incremental_vacuum:
+        if not os.path.exists(args.db):
+            p.error(f"no such database: {args.db}")
+        conn = sqlite3.connect(args.db, timeout=BUSY_TIMEOUT_SECONDS)
+        try:
+            print(enable_incremental_vacuum(conn, args.db))
+        finally:
+            conn.close()
+
+    if args.fetch_local_model:
+        print(fetch_local_model(args.model_name, args.model_dir))
+
+if __name__ == "__main__":
+    main()